@@ -32,17 +32,19 @@ Author: Yamaç Eren Ay
 """
 
 import asyncio
+import atexit
+import datetime
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 import bcrypt
 import json
-import openai
 
-from lib import Handler, connect_weaviate_client
-from lib import BubbleNotFoundError, InvalidUserError, DatabaseError, DuplicateBubbleError
+from startup import Startup
+from lib import query_flight, openai_flight, async_query_flight, async_openai_flight
+from lib import BubbleError, BubbleNotFoundError, InvalidUserError, DatabaseError, DuplicateBubbleError
 from functools import wraps
 
 # Load environment variables
@@ -54,6 +56,9 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 HOST = os.getenv('HOST', '0.0.0.0')
 PORT = int(os.getenv('PORT', 5000))
 DEBUG = os.getenv('DEBUG', 'true').lower() in ['true', '1', 't', 'y', 'yes']
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD')) if os.getenv('NEAR_DUPLICATE_THRESHOLD') else None  # e.g. 0.95, unset to disable
+NEAR_DUPLICATE_MERGE = os.getenv('NEAR_DUPLICATE_MERGE', 'false').lower() in ['true', '1', 't', 'y', 'yes']
+ASYNC_BACKEND = os.getenv('ASYNC_BACKEND', 'true').lower() in ['true', '1', 't', 'y', 'yes']  # Serve reads through the async clients
 
 if not OPENAI_API_KEY:
      raise ValueError("OpenAI API key is missing. Set it as an environment variable 'OPENAI_API_KEY'.")
@@ -66,32 +71,57 @@ if not ADMIN_USERNAME:
 if not ADMIN_PASSWORD:
      raise ValueError("Admin password is missing. Set it as an environment variable 'ADMIN_PASSWORD'.")
 
-openai.api_key = OPENAI_API_KEY
-
 app = Flask(__name__)
 
 # app.config['CACHE_TYPE'] = 'null'  # Disable caching for development
 app.secret_key = os.getenv('SECRET_KEY', 'super_secret_key')  # Use environment variable for security
 
 # Initialize the handler once (Singleton Pattern)
+startup = Startup()
 handler = None
 
-def initialize_handler():
-     global handler
-     if handler is None:
-          client = connect_weaviate_client(OPENAI_API_KEY, WCS_URL, WCS_API_KEY)
-          if client:
-                user = session.get('user', None)
-                handler = Handler(client, user)
-                handler.create_bubble_schema()
-
-# Ensure the handler is initialized before each request
+# Endpoints that need the warmed-up backend; everything else (login, about, probes) works without it
+BACKEND_ENDPOINTS = {'home', 'admin'}
+
+# Connect, verify the schema and prime caches in the background, retrying with backoff until ready
+def start_warm_up():
+     # Near-duplicate detection needs vectors of the content alone, so a new collection is created that way when it is enabled
+     return startup.start(OPENAI_API_KEY, WCS_URL, WCS_API_KEY, async_backend=ASYNC_BACKEND, content_only_vectors=NEAR_DUPLICATE_THRESHOLD is not None)
+
+atexit.register(startup.shutdown)
+
+# Serve user traffic only once the handler is warmed up
 @app.before_request
 def ensure_handler_initialized():
-     initialize_handler()
-     if 'user' in session and handler:
+     global handler
+     startup.ensure_started()  # Workers forked after the app was imported (gunicorn --preload) warm up on first use
+     if request.endpoint not in BACKEND_ENDPOINTS:
+          return
+     if not startup.ready:
+          return "🫧 Bubbl.ai is warming up, please try again in a moment.", 503, {'Retry-After': '5'}
+     handler = startup.handler
+     if 'user' in session:
           handler.user = session['user']  # Dynamically update the user in the handler
 
+# Servers that import the app (gunicorn, flask run) warm up right away instead of on the first request
+if __name__ != '__main__' and os.getenv('WARM_UP_ON_IMPORT', 'true').lower() in ['true', '1', 't', 'y', 'yes']:
+     start_warm_up()
+
+# Liveness probe: the process is up and serving requests
+@app.route('/healthz')
+def healthz():
+     return jsonify(status="alive", uptime=round(startup.uptime(), 3))
+
+# Readiness probe: warm-up finished and the backend is reachable
+@app.route('/readyz')
+def readyz():
+     return jsonify(startup.report()), 200 if startup.ready else 503
+
+# Request coalescing metrics for the Weaviate and OpenAI single-flight layers
+@app.route('/metrics')
+def metrics():
+     return jsonify(singleflight={flight.name: flight.metrics() for flight in (query_flight, openai_flight, async_query_flight, async_openai_flight)})
+
 # Helper function for Flash Messages
 def flash_message(message, category="info"):
      flash(message, category)
@@ -102,6 +132,12 @@ def handle_pagination(request, limit=5):
      limit = request.args.get('limit', limit, type=int)
      return limit, offset
 
+# Helper function to parse an optional date field (YYYY-MM-DD) as a UTC datetime
+def parse_date(value):
+     if not value:
+          return None
+     return datetime.datetime.combine(datetime.date.fromisoformat(value), datetime.time(), tzinfo=datetime.timezone.utc)
+
 # Custom Admin Authentication Decorator
 def admin_required(f):
      @wraps(f)
@@ -198,6 +234,24 @@ def admin():
                           flash_message("Something went wrong. Try again! 🌬️", "error")
                 except FileNotFoundError:
                      flash_message("File not found. 🚫", "error")
+          elif 'count_bubbles' in request.form or 'delete_bubbles' in request.form:  # Handle filtered batch deletion
+                dry_run = 'count_bubbles' in request.form
+                try:
+                     result = handler.remove_bubbles_where(
+                          user=request.form.get('delete_user', '').strip(),
+                          category=request.form.get('delete_category', '').strip(),
+                          created_after=parse_date(request.form.get('delete_after')),
+                          created_before=parse_date(request.form.get('delete_before')),
+                          dry_run=dry_run,
+                     )
+                     if dry_run:
+                          flash_message(f"🔢 {result['matches']} bubbles match the filter.", "info")
+                     else:
+                          flash_message(f"💥 Popped {result['deleted']} of {result['matches']} bubbles! 🫧", "success")
+                except ValueError:
+                     flash_message("Invalid date. 🚫", "error")
+                except BubbleError as e:
+                     flash_message(str(e), "error")
      return render_template('admin.html')
 
 @app.route('/home', methods=['GET', 'POST'])
@@ -227,24 +281,18 @@ def home():
 
      relevant_users_rank = session.get('relevant_users_rank')
 
-     relevant_bubbles = handler.query_most_relevant_bubbles(
+     # Query the page and whether there are more bubbles for the "Next" page (concurrently on the async backend)
+     page_query = dict(
           query_user=options['query_user'],
           query_text=options['query_text'],
           query_category=options['query_category'],
           limit=options['limit_bubbles'],
           offset=options['offset'],
      )
-
-     # Determine if there are more bubbles for the "Next" page
-     next_offset = options['offset'] + options['limit_bubbles']
-     has_more = handler.query_most_relevant_bubbles(
-          query_user=options['query_user'],
-          query_text=options['query_text'],
-          query_category=options['query_category'],
-          limit=1,
-          offset=next_offset,
-     )
-     options['has_more'] = len(has_more) > 0 if has_more is not None else False
+     if startup.async_handler:
+          relevant_bubbles, options['has_more'] = startup.run(startup.async_handler.query_page(**page_query))
+     else:
+          relevant_bubbles, options['has_more'] = handler.query_page(**page_query)
 
      similar_users_rank_shown = None
      if isinstance(relevant_users_rank, list):
@@ -268,7 +316,10 @@ def home():
                 options['query_category_rank'] = request.form.get('query_category_rank', options['query_category_rank']).strip()
                 # Run the async function
                 try:
-                     relevant_users_rank = asyncio.run(handler.search_users_by_profile(options['query_text_rank'], options['query_category_rank'], options['limit_bubbles_rank'], options['limit_bubble_user_rank']))
+                     if startup.async_handler:
+                          relevant_users_rank = startup.run(startup.async_handler.search_users_by_profile(options['query_text_rank'], options['query_category_rank'], options['limit_bubbles_rank'], options['limit_bubble_user_rank'], user=user_name))
+                     else:
+                          relevant_users_rank = asyncio.run(handler.search_users_by_profile(options['query_text_rank'], options['query_category_rank'], options['limit_bubbles_rank'], options['limit_bubble_user_rank']))
                      session['relevant_users_rank'] = relevant_users_rank  # Cache the result in session
                 except BubbleNotFoundError as e:
                      flash_message(str(e), "error")
@@ -283,7 +334,7 @@ def home():
                 else:
                      try:
                           bubble = [{"content": content, "user": user_name, "category": category}]
-                          result = handler.insert_bubbles(bubble)
+                          result = handler.insert_bubbles(bubble, near_duplicate_threshold=NEAR_DUPLICATE_THRESHOLD, merge_near_duplicates=NEAR_DUPLICATE_MERGE)
                           flash_message("✨ Your bubble has been blown! 🎉", "success")
                           options['query_user'] = user_name
                      except DuplicateBubbleError as e:
@@ -324,4 +375,7 @@ if __name__ == '__main__':
      parser.add_argument('--port', default=PORT, type=int, help="Port number")
      parser.add_argument('--debug', default=DEBUG, type=bool, help="Debug mode")
      args = parser.parse_args()
+     if not args.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+          start_warm_up()
+          startup.wait()  # Accept traffic only after the first warm-up attempt (skipped in the reloader parent)
      app.run(host=args.host, port=args.port, debug=args.debug)
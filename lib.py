@@ -31,16 +31,90 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Author: Yamaç Eren Ay
 """
 
+from __future__ import annotations
+
+import concurrent.futures
 import datetime
+import importlib
 import logging
+import types
 
-from typing import List, Dict, Optional, Union
-import numpy as np
+from typing import Callable, List, Dict, Optional, Union
 import asyncio
-import openai
-import weaviate
-import weaviate.classes as wvc
-import humanize
+
+from singleflight import AsyncSingleFlight, SingleFlight, SingleFlightTimeoutError
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module proxy that defers the actual import until the first attribute access.
+    """
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Return a lazily imported module, e.g. `np = lazy_import("numpy")`.
+    """
+    return LazyModule(name)
+
+
+# Heavy dependencies are only imported once a code path needs them (or during warm-up)
+np = lazy_import("numpy")
+openai = lazy_import("openai")
+weaviate = lazy_import("weaviate")
+wvc = lazy_import("weaviate.classes")
+humanize = lazy_import("humanize")
+
+# Concurrent identical queries / OpenAI calls share one backend call (single-flight)
+QUERY_COALESCE_TIMEOUT = 30.0
+OPENAI_COALESCE_TIMEOUT = 60.0
+query_flight = SingleFlight("weaviate", timeout=QUERY_COALESCE_TIMEOUT)
+openai_flight = SingleFlight("openai", timeout=OPENAI_COALESCE_TIMEOUT)
+async_query_flight = AsyncSingleFlight("weaviate-async", timeout=QUERY_COALESCE_TIMEOUT)
+async_openai_flight = AsyncSingleFlight("openai-async", timeout=OPENAI_COALESCE_TIMEOUT)
+
+# Embedding model shared by the Weaviate vectorizer and direct OpenAI calls, so their vectors are comparable
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Near-duplicate detection: cosine similarity above which bubbles count as near-copies, and the minimum similarity
+# between a stored vector and our own embedding of its content for the two to count as the same embedding space
+NEAR_DUPLICATE_THRESHOLD = 0.95
+EMBEDDING_SPACE_TOLERANCE = 0.999
+NEAR_DUPLICATE_CONCURRENCY = 8  # near_vector searches in flight at once while checking a batch
+embedding_space_cache: Dict[int, bool] = {}
+
+# Number of bubbles fetched and deleted per round trip in filtered batch deletions
+DELETE_CHUNK_SIZE = 1000
+
+# Callbacks notified with the list of removed bubbles ({"uuid", "user", "category"}) after each deletion
+delete_hooks: List[Callable[[List[Dict]], None]] = []
+
+def register_delete_hook(hook: Callable[[List[Dict]], None]):
+    """
+    Register a callback so derived indexes and caches can drop removed bubbles in bulk.
+    """
+    delete_hooks.append(hook)
+    return hook
+
+def run_delete_hooks(bubbles: List[Dict]):
+    if not bubbles:
+        return
+    for hook in delete_hooks:
+        try:
+            hook(bubbles)
+        except Exception as e:
+            logging.error("An error occurred in delete hook %s: %s", getattr(hook, "__name__", hook), e)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, filename="messages.log")
@@ -64,6 +138,12 @@ class BubbleNotFoundError(BubbleError):
         super().__init__(self.message)
 
 
+class NearDuplicateBubbleError(DuplicateBubbleError):
+    """Raised when trying to insert a bubble that is a near-copy of an existing one."""
+    def __init__(self, message="A very similar bubble already exists."):
+        super().__init__(message)
+
+
 class InvalidUserError(BubbleError):
     """Raised when a user attempts an unauthorized action."""
     def __init__(self, message="Unauthorized action by the user."):
@@ -90,14 +170,29 @@ def connect_weaviate_client(openai_api_key: str, wcs_url: str, wcs_api_key: str)
         }
     )
 
-def perform_query(client, query_user: str = "", not_query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0):
+def connect_weaviate_async_client(openai_api_key: str, wcs_url: str, wcs_api_key: str):
     """
-    Perform a query to find bubbles by a specific user and optionally a category.
+    Create an async Weaviate client for the same instance; it still has to be connected with `await client.connect()`.
+    """
+    return weaviate.use_async_with_weaviate_cloud(
+        cluster_url=wcs_url,
+        auth_credentials=weaviate.auth.AuthApiKey(wcs_api_key),
+        headers={
+            "X-OpenAI-Api-Key": openai_api_key
+        }
+    )
+
+def connect_openai_async_client(openai_api_key: str):
+    """
+    Create an async OpenAI client.
+    """
+    return openai.AsyncOpenAI(api_key=openai_api_key)
+
+def build_query_filters(query_user: str = "", not_query_user: str = "", query_category: str = ""):
+    """
+    Build the filter for a bubble query by user (or everyone but a user) and optionally a category.
+    Returns None if the filters contradict each other.
     """
-    # Query the 'Bubble' collection for bubbles by this user
-    bubble_collection = client.collections.get("Bubble")
-    
-    # Constructing the filter for the user and optionally the category
     logging.info("Building filters for user and category.")
     filters = wvc.query.Filter.by_property("content").like("*")  # Default filter to match all content (wildcard)
     if query_user and not_query_user and query_user == not_query_user:
@@ -112,36 +207,58 @@ def perform_query(client, query_user: str = "", not_query_user: str = "", query_
     if query_category:
         logging.info("Adding category filter for: '%s'.", query_category)
         filters &= wvc.query.Filter.by_property("category").equal(query_category)
+    return filters
+
+def build_query(query_user: str = "", not_query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0):
+    """
+    Build the query method name ('near_text' or 'fetch_objects') and its keyword arguments, shared by the sync and async clients.
+    Returns None if the filters contradict each other.
+    """
+    # Constructing the filter for the user and optionally the category
+    filters = build_query_filters(query_user, not_query_user, query_category)
+    if filters is None:
+        return None
+    kwargs = dict(
+        filters=filters,
+        limit=limit,
+        offset=offset,
+        return_metadata=wvc.query.MetadataQuery(creation_time=True),
+    )
 
     # Perform the query based on whether query_text is provided
     if query_text:
         logging.info("Performing near_text search with query text: '%s'.", query_text)
-        try:
-            response = bubble_collection.query.near_text(
-                query=query_text,
-                filters=filters,
-                limit=limit,
-                offset=offset,
-                return_metadata=wvc.query.MetadataQuery(creation_time=True),
-            )
-        except Exception as e:
-            logging.error("An error occurred during near_text query execution: %s", e)
-            return None
-    else:
-        logging.info("Performing fetch_objects query without near_text.")
-        try:
-            response = bubble_collection.query.fetch_objects(
-                filters=filters,
-                limit=limit,
-                offset=offset,
-                return_metadata=wvc.query.MetadataQuery(creation_time=True),
-                sort=wvc.query.Sort.by_property(name="_creationTimeUnix", ascending=False),  # Use timestamp index for sorting
-            )
-        except Exception as e:
-            logging.error("An error occurred during fetch_objects query execution: %s", e)
-            return None
-    
-    return response
+        return "near_text", dict(kwargs, query=query_text)
+    logging.info("Performing fetch_objects query without near_text.")
+    return "fetch_objects", dict(kwargs, sort=wvc.query.Sort.by_property(name="_creationTimeUnix", ascending=False))  # Use timestamp index for sorting
+
+def perform_query(client, query_user: str = "", not_query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0):
+    """
+    Perform a query to find bubbles by a specific user and optionally a category.
+    """
+    query = build_query(query_user, not_query_user, query_text, query_category, limit, offset)
+    if query is None:
+        return None
+    method, kwargs = query
+    try:
+        return getattr(client.collections.get("Bubble").query, method)(**kwargs)
+    except Exception as e:
+        logging.error("An error occurred during %s query execution: %s", method, e)
+        return None
+
+async def perform_query_async(client, query_user: str = "", not_query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0):
+    """
+    Perform a query to find bubbles by a specific user and optionally a category with the async Weaviate client.
+    """
+    query = build_query(query_user, not_query_user, query_text, query_category, limit, offset)
+    if query is None:
+        return None
+    method, kwargs = query
+    try:
+        return await getattr(client.collections.get("Bubble").query, method)(**kwargs)
+    except Exception as e:
+        logging.error("An error occurred during %s query execution: %s", method, e)
+        return None
 
 def process_bubbles_response(response):
     bubbles = []
@@ -164,11 +281,38 @@ def query_most_relevant_bubbles(client, not_query_user: str = "", query_user: st
     Query the 'Bubble' collection to find the most relevant k bubbles based on a text query.
     """
     logging.info("Querying top %d most relevant bubbles for text: '%s'...", limit, query_text)
-    
-    # Perform the query
-    response = perform_query(client, query_user=query_user, not_query_user=not_query_user, query_text=query_text, query_category=query_category, limit=limit, offset=offset)
-    bubbles = process_bubbles_response(response)
-    return bubbles
+
+    def run_query():
+        response = perform_query(client, query_user=query_user, not_query_user=not_query_user, query_text=query_text, query_category=query_category, limit=limit, offset=offset)
+        return process_bubbles_response(response)
+
+    # Perform the query, sharing it with identical concurrent queries
+    key = ("query", id(client), not_query_user, query_user, query_text, query_category, limit, offset)
+    try:
+        bubbles = query_flight.do(key, run_query)
+    except SingleFlightTimeoutError as e:
+        logging.error("An error occurred while waiting for a coalesced query: %s", e)
+        return []
+    # Each caller gets its own copies since callers annotate the bubbles in place
+    return [dict(bubble) for bubble in bubbles]
+
+async def query_most_relevant_bubbles_async(client, not_query_user: str = "", query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0):
+    """
+    Query the 'Bubble' collection for the most relevant bubbles with the async Weaviate client.
+    """
+    logging.info("Querying top %d most relevant bubbles for text: '%s'...", limit, query_text)
+
+    async def run_query():
+        response = await perform_query_async(client, query_user=query_user, not_query_user=not_query_user, query_text=query_text, query_category=query_category, limit=limit, offset=offset)
+        return process_bubbles_response(response)
+
+    key = ("query", id(client), not_query_user, query_user, query_text, query_category, limit, offset)
+    try:
+        bubbles = await async_query_flight.do(key, run_query)
+    except SingleFlightTimeoutError as e:
+        logging.error("An error occurred while waiting for a coalesced query: %s", e)
+        return []
+    return [dict(bubble) for bubble in bubbles]
 
 def group_bubbles_by_user(bubbles: List[Dict]):
     """
@@ -187,9 +331,10 @@ def group_bubbles_by_user(bubbles: List[Dict]):
     
     return user_bubbles
 
-async def summarize_with_gpt(content: str) -> str:
+async def summarize_with_gpt(content: str, openai_client=None) -> str:
     """
     Asynchronously call OpenAI's chat-based API to summarize the given content using the correct endpoint for chat models.
+    Uses the given async OpenAI client natively, or the module-level sync API in a thread otherwise.
     """
     logging.info("Summarizing content with GPT: %s...", content[:50])
 
@@ -200,26 +345,38 @@ async def summarize_with_gpt(content: str) -> str:
     ]
 
     # Call the GPT-4 or GPT-3.5-turbo chat model to summarize the content
-    response = await asyncio.to_thread(
-        openai.chat.completions.create,
-        model="gpt-4o",
-        messages=messages,
-        temperature=0.7,
-        max_tokens=100
-    )
+    if openai_client is not None:
+        response = await async_openai_flight.do(
+            ("summarize", content),
+            openai_client.chat.completions.create,
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=100
+        )
+    else:
+        response = await asyncio.to_thread(
+            openai_flight.do,
+            ("summarize", content),
+            openai.chat.completions.create,
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=100
+        )
 
     # Extract the summarized content from the response
     summary = response.choices[0].message.content.strip()
     return summary
 
-async def summarize_user_content_async(user_bubbles: Dict[str, str]) -> Dict[str, str]:
+async def summarize_user_content_async(user_bubbles: Dict[str, str], openai_client=None) -> Dict[str, str]:
     """
     Summarize the content for each user using GPT in an asynchronous and efficient manner.
     """
     logging.info("Summarizing user content with GPT...")
 
     # Prepare async tasks to summarize content for each user
-    tasks = [summarize_with_gpt(content) for content in user_bubbles.values()]
+    tasks = [summarize_with_gpt(content, openai_client) for content in user_bubbles.values()]
 
     # Gather all summaries in parallel
     summaries = await asyncio.gather(*tasks)
@@ -227,24 +384,27 @@ async def summarize_user_content_async(user_bubbles: Dict[str, str]) -> Dict[str
     # Return a dictionary mapping users to their summaries
     return {user: summary for user, summary in zip(user_bubbles.keys(), summaries)}
 
-async def embed_text_with_openai_async(text: str) -> np.ndarray:
+async def embed_text_with_openai_async(text: str, openai_client=None) -> np.ndarray:
     """
-    Embed a text asynchronously using OpenAI's embedding API in a thread.
+    Embed a text asynchronously using OpenAI's embedding API, natively with an async client or in a thread.
     """
     logging.info("Embedding text asynchronously with OpenAI: %s...", text[:50])
     
-    # Run the synchronous OpenAI API call in a separate thread
-    response = await asyncio.to_thread(openai.embeddings.create, input=text, model="text-embedding-ada-002")
+    if openai_client is not None:
+        response = await async_openai_flight.do(("embed", text), openai_client.embeddings.create, input=text, model=EMBEDDING_MODEL)
+    else:
+        # Run the synchronous OpenAI API call in a separate thread
+        response = await asyncio.to_thread(openai_flight.do, ("embed", text), openai.embeddings.create, input=text, model=EMBEDDING_MODEL)
     
     # Extract the embedding
     embedding = response.data[0].embedding
     return np.array(embedding)
 
-async def embed_user_summaries_async(user_summaries: Dict[str, str]) -> Dict[str, np.ndarray]:
+async def embed_user_summaries_async(user_summaries: Dict[str, str], openai_client=None) -> Dict[str, np.ndarray]:
     """
     Embed each user's summary using OpenAI API asynchronously to create vector representations of user opinions.
     """
-    tasks = [embed_text_with_openai_async(summary) for user, summary in user_summaries.items()]
+    tasks = [embed_text_with_openai_async(summary, openai_client) for user, summary in user_summaries.items()]
     results = await asyncio.gather(*tasks)
     return {user: embedding for user, embedding in zip(user_summaries.keys(), results)}
 
@@ -272,10 +432,185 @@ def compute_user_similarity(user_embeddings: Dict[str, np.ndarray], query_embedd
     
     return similarities
 
-def insert_bubbles(client, bubbles: List[Dict]):
+def get_default_vector(obj) -> Optional[List[float]]:
+    """
+    Return the default vector of a Weaviate object (dict for named vectors, list for older clients).
+    """
+    vector = obj.vector
+    if isinstance(vector, dict):
+        vector = vector.get("default")
+    return vector or None
+
+def embed_texts_with_openai(texts: List[str]) -> np.ndarray:
+    """
+    Embed a batch of texts with a single OpenAI embedding call.
+    """
+    logging.info("Embedding %d texts with OpenAI...", len(texts))
+    response = openai.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+    return np.array([item.embedding for item in sorted(response.data, key=lambda item: item.index)], dtype=np.float32)
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def content_only_vectors(config) -> bool:
+    """
+    Check whether a collection config embeds the bubble content alone with EMBEDDING_MODEL and compares vectors by cosine distance,
+    i.e. the layout `create_bubble_schema(content_only_vectors=True)` creates: no collection or property names, `user` and `category` skipped.
+    """
+    vectorizer = config.vectorizer_config
+    index = config.vector_index_config
+    # Near-duplicate searches turn the similarity threshold into a cosine distance cutoff
+    if index is None or index.distance_metric != wvc.config.VectorDistances.COSINE:
+        return False
+    if vectorizer is None or vectorizer.vectorizer != wvc.config.Vectorizers.TEXT2VEC_OPENAI:
+        return False
+    if vectorizer.vectorize_collection_name or (vectorizer.model or {}).get("model") != EMBEDDING_MODEL:
+        return False
+    for prop in config.properties:
+        prop_vectorizer = prop.vectorizer_config
+        if prop_vectorizer is None:
+            return False
+        if prop.name == "content":
+            if prop_vectorizer.skip or prop_vectorizer.vectorize_property_name:
+                return False
+        elif not prop_vectorizer.skip:
+            return False
+    return True
+
+def embedding_space_matches(collection) -> bool:
+    """
+    Check that the collection's stored vectors live in the same space as `embed_texts_with_openai`:
+    the config must embed content alone (`content_only_vectors`) and one stored vector must match our own embedding.
+    """
+    if not content_only_vectors(collection.config.get()):
+        return False
+
+    # Configuration alone does not rule out input normalisation on the server, so compare against one stored vector
+    sample = collection.query.fetch_objects(limit=1, include_vector=True, return_properties=["content"]).objects
+    if sample and get_default_vector(sample[0]):
+        stored = np.array(get_default_vector(sample[0]), dtype=np.float32)
+        embedded = embed_texts_with_openai([sample[0].properties.get("content") or ""])[0]
+        stored, embedded = normalize_rows(np.stack([stored, embedded]))
+        return float(stored @ embedded) >= EMBEDDING_SPACE_TOLERANCE
+    return True
+
+def embedding_space_verified(client) -> bool:
+    """
+    Cached `embedding_space_matches` for the client's 'Bubble' collection.
+    """
+    key = id(client)
+    if key not in embedding_space_cache:
+        try:
+            embedding_space_cache[key] = embedding_space_matches(client.collections.get("Bubble"))
+        except Exception as e:
+            logging.error("An error occurred while checking the collection's embedding space: %s", e)
+            return False
+        if not embedding_space_cache[key]:
+            logging.warning("The 'Bubble' collection was not created with content-only %s vectors and cosine distance; near-duplicate detection is disabled.", EMBEDDING_MODEL)
+    return embedding_space_cache[key]
+
+def find_near_duplicates(client, bubbles: List[Dict], threshold: float = NEAR_DUPLICATE_THRESHOLD):
+    """
+    Find bubbles in a batch that are near-copies of the same user's existing bubbles or of an earlier bubble in the batch.
+    The batch is embedded in one OpenAI call; the vectors are matched server-side against the user's bubbles
+    (near_vector, limit 1, distance cutoff) concurrently, and the batch is compared against itself in one matrix product.
+    Returns (matches, vectors): matches maps a batch index to {"uuid" | "index", "similarity"} of what it duplicates,
+    vectors maps batch indexes to vectors proven to live in the collection's embedding space (empty if unverified).
+    """
+    if not embedding_space_verified(client):
+        return {}, {}
+    try:
+        embedded = embed_texts_with_openai([bubble["content"] for bubble in bubbles])
+    except Exception as e:
+        logging.warning("Embedding failed, skipping near-duplicate detection: %s", e)
+        return {}, {}
+    vectors = dict(enumerate(embedded))
+
+    collection = client.collections.get("Bubble")
+
+    def search(i: int):
+        return collection.query.near_vector(
+            near_vector=vectors[i].tolist(),
+            filters=wvc.query.Filter.by_property("user").equal(bubbles[i]["user"]),
+            limit=1,
+            distance=1 - threshold,
+            return_metadata=wvc.query.MetadataQuery(distance=True),
+            return_properties=["content"],
+        )
+
+    matches: Dict[int, Dict] = {}
+    try:
+        if len(bubbles) == 1:
+            responses = [search(0)]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(bubbles), NEAR_DUPLICATE_CONCURRENCY)) as pool:
+                responses = list(pool.map(search, range(len(bubbles))))
+    except Exception as e:
+        logging.error("An error occurred while searching for near-duplicate bubbles: %s", e)
+        raise DatabaseError("Failed to check for near-duplicate bubbles.")
+    for i, response in enumerate(responses):
+        if response.objects:
+            matches[i] = {"uuid": response.objects[0].uuid, "similarity": 1 - response.objects[0].metadata.distance}
+
+    # Near-copies within the batch: one similarity matrix, each bubble compared to the earlier ones of the same user
+    similarities = normalize_rows(embedded) @ normalize_rows(embedded).T
+    for i, bubble in enumerate(bubbles):
+        if i in matches:
+            continue
+        for j in range(i):
+            if j not in matches and bubbles[j]["user"] == bubble["user"] and similarities[i, j] >= threshold:
+                matches[i] = {"index": j, "similarity": float(similarities[i, j])}
+                break
+    return matches, vectors
+
+def merge_into_near_duplicates(collection, bubbles: List[Dict], matches: Dict[int, Dict], vectors: Dict[int, np.ndarray]):
+    """
+    Merge near-duplicates instead of inserting them: the matched bubble takes over the newer wording (and category, if given).
+    Near-copies within the batch are first folded into the earliest bubble they match.
+    Returns (merged, roots): batch index -> UUID of the existing bubble it was merged into, and
+    batch index -> index of the earlier batch bubble it was folded into.
+    """
+    roots = {}
+    for i in sorted(matches):
+        root = matches[i].get("index")
+        if root is None:
+            continue
+        while matches.get(root, {}).get("index") is not None:
+            root = matches[root]["index"]
+        bubble = bubbles[i]
+        bubbles[root] = {**bubbles[root], "content": bubble["content"], "category": bubble.get("category") or bubbles[root].get("category")}
+        if i in vectors:
+            vectors[root] = vectors[i]
+        roots[i] = root
+
+    merged = {}
+    for i in sorted(matches):
+        match = matches[i]
+        if match.get("uuid") is None:
+            continue
+        properties = {"content": bubbles[i]["content"]}
+        if bubbles[i].get("category"):
+            properties["category"] = bubbles[i]["category"]
+        vector = vectors.get(i)
+        try:
+            collection.data.update(uuid=match["uuid"], properties=properties, vector=vector.tolist() if vector is not None else None)
+        except Exception as e:
+            logging.error("An error occurred while merging a near-duplicate bubble: %s", e)
+            raise DatabaseError("Failed to merge the bubble into its near-duplicate.")
+        logging.info("Merged near-duplicate bubble into %s (similarity %.3f).", match["uuid"], match["similarity"])
+        merged[i] = match["uuid"]
+    for i, root in roots.items():
+        if root in merged:
+            merged[i] = merged[root]
+    return merged, roots
+
+def insert_bubbles(client, bubbles: List[Dict], near_duplicate_threshold: Optional[float] = None, merge_near_duplicates: bool = False):
     """
     Insert bubbles into the Weaviate database.
     Raises DuplicateBubbleError if a bubble with the same content exists.
+    With a near_duplicate_threshold, also raises NearDuplicateBubbleError for near-copies of the same user's bubbles,
+    or merges them into the matching bubble when merge_near_duplicates is set.
     """
     logging.info("Inserting bubbles into the database...")
     
@@ -289,13 +624,34 @@ def insert_bubbles(client, bubbles: List[Dict]):
         )
         if result.objects:
             raise DuplicateBubbleError(f"Bubble with content '{bubble['content']}' already exists.")
+
+    matches, vectors, merged, roots = {}, {}, {}, {}
+    if near_duplicate_threshold is not None:
+        bubbles = list(bubbles)
+        matches, vectors = find_near_duplicates(client, bubbles, near_duplicate_threshold)
+        if matches and not merge_near_duplicates:
+            i = min(matches)
+            raise NearDuplicateBubbleError(f"Bubble with content '{bubbles[i]['content']}' is too similar to another bubble ({matches[i]['similarity']:.0%} similar).")
+        merged, roots = merge_into_near_duplicates(collection, bubbles, matches, vectors)
+
+    # Bubbles embedded during the near-duplicate check are inserted with their vectors so Weaviate does not re-vectorize them
+    indexes = [i for i in range(len(bubbles)) if i not in matches]
+    if not indexes:
+        return merged
     try:
-        objects = [wvc.data.DataObject(properties=bubble) for bubble in bubbles]
+        objects = [wvc.data.DataObject(properties=bubbles[i], vector=vectors[i].tolist() if i in vectors else None) for i in indexes]
         response = collection.data.insert_many(objects)
-        return response.uuids
     except Exception as e:
         logging.error("An error occurred: %s", e)
         raise DatabaseError("Failed to insert bubbles into the database.")
+    if not matches:
+        return response.uuids
+    uuids = {indexes[position]: uuid for position, uuid in response.uuids.items()}
+    for i, root in roots.items():
+        if i not in merged:
+            uuids[i] = uuids[root]
+    uuids.update(merged)
+    return uuids
 
 def get_bubble(client, user: str, uuid: str) -> tuple[Optional[Dict], bool]:
     """
@@ -318,10 +674,94 @@ def remove_bubble(client, user: str, uuid: str):
     try:
         client.collections.get("Bubble").data.delete_by_id(uuid)
         logging.info("Bubble with UUID %s removed successfully.", uuid)
-        return True
     except Exception as e:
         logging.error("An unexpected error occurred: %s", e)
         raise DatabaseError("Failed to remove the bubble.")
+    run_delete_hooks([{"uuid": old_bubble.uuid, "user": user, "category": old_bubble.properties.get("category")}])
+    return True
+
+def build_delete_filters(user: str = "", category: str = "", created_after: Optional[datetime.datetime] = None, created_before: Optional[datetime.datetime] = None):
+    """
+    Build a filter matching bubbles by user, category and/or creation time range [created_after, created_before).
+    Raises BubbleError if no criterion is given, so a batch deletion can never match the whole collection by accident.
+    """
+    filters = []
+    if user:
+        filters.append(wvc.query.Filter.by_property("user").equal(user))
+    if category:
+        filters.append(wvc.query.Filter.by_property("category").equal(category))
+    if created_after:
+        filters.append(wvc.query.Filter.by_creation_time().greater_or_equal(created_after))
+    if created_before:
+        filters.append(wvc.query.Filter.by_creation_time().less_than(created_before))
+    if not filters:
+        raise BubbleError("At least one of user, category or time range is required for a batch deletion.")
+    combined = filters[0]
+    for f in filters[1:]:
+        combined &= f
+    return combined
+
+def count_bubbles(client, filters) -> int:
+    """
+    Count the bubbles matching the given filter.
+    """
+    try:
+        response = client.collections.get("Bubble").aggregate.over_all(filters=filters, total_count=True)
+        return response.total_count
+    except Exception as e:
+        logging.error("An error occurred while counting bubbles: %s", e)
+        raise DatabaseError("Failed to count the bubbles.")
+
+def timestamps_indexed(collection) -> bool:
+    """
+    Check whether the collection's inverted index covers creation times, which filtering by time range requires.
+    """
+    try:
+        return bool(collection.config.get().inverted_index_config.index_timestamps)
+    except Exception as e:
+        logging.error("An error occurred while reading the collection config: %s", e)
+        raise DatabaseError("Failed to read the bubble collection config.")
+
+def remove_bubbles_where(client, user: str = "", category: str = "", created_after: Optional[datetime.datetime] = None, created_before: Optional[datetime.datetime] = None, dry_run: bool = False, chunk_size: int = DELETE_CHUNK_SIZE) -> Dict[str, int]:
+    """
+    Remove all bubbles matching a user, category and/or creation time range with batch deletes.
+    Bubbles are removed in chunks of `chunk_size` (one fetch and one delete_many per chunk) and delete hooks
+    are notified once per chunk. With dry_run, only the number of matching bubbles is returned.
+    """
+    filters = build_delete_filters(user, category, created_after, created_before)
+    collection = client.collections.get("Bubble")
+    if (created_after or created_before) and not timestamps_indexed(collection):
+        raise BubbleError("Filtering by creation time needs a 'Bubble' collection created with index_timestamps=True. See 'Snapshots' in SETUP.md to migrate.")
+    matches = count_bubbles(client, filters)
+    logging.info("%d bubbles match the batch deletion (user='%s', category='%s', from=%s, to=%s).", matches, user, category, created_after, created_before)
+    result = {"matches": matches, "deleted": 0, "failed": 0, "dry_run": dry_run}
+    if dry_run or matches == 0:
+        return result
+
+    failed_uuids = set()
+    while True:
+        try:
+            # Bubbles that failed to delete still match; leave them out so they don't take up every chunk
+            chunk_filters = filters & wvc.query.Filter.by_id().contains_none(list(failed_uuids)) if failed_uuids else filters
+            chunk = collection.query.fetch_objects(filters=chunk_filters, limit=chunk_size, return_properties=["user", "category"])
+            if not chunk.objects:
+                break
+            uuids = [obj.uuid for obj in chunk.objects]
+            response = collection.data.delete_many(where=wvc.query.Filter.by_id().contains_any(uuids), verbose=True)
+        except Exception as e:
+            logging.error("An error occurred during batch deletion: %s", e)
+            raise DatabaseError("Failed to remove the bubbles.")
+
+        result["deleted"] += response.successful
+        # Hooks only see bubbles that are actually gone; failed ones still exist
+        deleted = {str(result.uuid) for result in response.objects or [] if result.successful}
+        failed_uuids.update(obj.uuid for obj in chunk.objects if str(obj.uuid) not in deleted)
+        result["failed"] = len(failed_uuids)
+        run_delete_hooks([{"uuid": obj.uuid, "user": obj.properties.get("user"), "category": obj.properties.get("category")} for obj in chunk.objects if str(obj.uuid) in deleted])
+        logging.info("Deleted chunk of %d bubbles (%d failed).", response.successful, response.failed)
+
+    logging.info("Batch deletion removed %d of %d bubbles.", result["deleted"], matches)
+    return result
 
 async def perform_similarity_search_users_by_profile(
         client, 
@@ -338,30 +778,69 @@ async def perform_similarity_search_users_by_profile(
     if len(bubbles_user) == 0:
         raise BubbleNotFoundError("No user profile found for the current user.")
     bubbles = query_most_relevant_bubbles(client, not_query_user=user, query_text=query_text, query_category=query_category, limit=limit)
+    return await rank_users_by_profile(user, bubbles_user, bubbles)
+
+async def perform_similarity_search_users_by_profile_async(
+        client,
+        openai_client,
+        user: str,
+        query_text: str,
+        query_category: str,
+        limit: int,
+        limit_user: int,
+    ):
+    """
+    Same as `perform_similarity_search_users_by_profile` with async clients; both profile queries run concurrently.
+    """
+    bubbles_user, bubbles = await asyncio.gather(
+        query_most_relevant_bubbles_async(client, query_user=user, query_text=query_text, query_category=query_category, limit=limit_user),
+        query_most_relevant_bubbles_async(client, not_query_user=user, query_text=query_text, query_category=query_category, limit=limit),
+    )
+    return await rank_users_by_profile(user, bubbles_user, bubbles, openai_client)
+
+async def rank_users_by_profile(user: str, bubbles_user: List[Dict], bubbles: List[Dict], openai_client=None):
+    """
+    Rank other users by the similarity of their summarized bubbles to the current user's summarized bubbles.
+    """
+    if len(bubbles_user) == 0:
+        raise BubbleNotFoundError("No user profile found for the current user.")
     if len(bubbles) == 0:
         raise BubbleNotFoundError("No user profiles found for the query.")
-    bubbles.extend(bubbles_user)
+    bubbles = bubbles + bubbles_user
     bubbles_by_user = group_bubbles_by_user(bubbles)
-    summary_by_user = await summarize_user_content_async(bubbles_by_user)
-    embedding_by_user = await embed_user_summaries_async(summary_by_user)
+    summary_by_user = await summarize_user_content_async(bubbles_by_user, openai_client)
+    embedding_by_user = await embed_user_summaries_async(summary_by_user, openai_client)
     embedding_user = embedding_by_user.pop(user)
     ranked_users = compute_user_similarity(embedding_by_user, embedding_user)
     return ranked_users
 
-def create_bubble_schema(client):
+def create_bubble_schema(client, content_only_vectors: bool = False):
     """
     Create a 'Bubble' collection if it doesn't exist, with indexing by vector and timestamp.
+    By default, vectors embed the collection name, content, user and category. With content_only_vectors, they embed
+    the content alone with EMBEDDING_MODEL, which near-duplicate detection needs but which also changes near_text ranking.
     """
     if not client.collections.exists("Bubble"):
-        bubbles = client.collections.create(
-            name="Bubble",
-            vectorizer_config=wvc.config.Configure.Vectorizer.text2vec_openai(),    # Use OpenAI API for text2vec
-            generative_config=wvc.config.Configure.Generative.cohere(),             # Use Cohere for generative tasks
-            properties=[
+        if content_only_vectors:
+            vectorizer_config = wvc.config.Configure.Vectorizer.text2vec_openai(model=EMBEDDING_MODEL, vectorize_collection_name=False)    # Embed the content alone with OpenAI
+            properties = [
+                wvc.config.Property(name="content", data_type=wvc.config.DataType.TEXT, vectorize_property_name=False),
+                wvc.config.Property(name="user", data_type=wvc.config.DataType.TEXT, skip_vectorization=True),
+                wvc.config.Property(name="category", data_type=wvc.config.DataType.TEXT, skip_vectorization=True),
+            ]
+        else:
+            vectorizer_config = wvc.config.Configure.Vectorizer.text2vec_openai()    # Use OpenAI API for text2vec
+            properties = [
                 wvc.config.Property(name="content", data_type=wvc.config.DataType.TEXT),
                 wvc.config.Property(name="user", data_type=wvc.config.DataType.TEXT),
                 wvc.config.Property(name="category", data_type=wvc.config.DataType.TEXT),
             ]
+        bubbles = client.collections.create(
+            name="Bubble",
+            vectorizer_config=vectorizer_config,
+            generative_config=wvc.config.Configure.Generative.cohere(),             # Use Cohere for generative tasks
+            inverted_index_config=wvc.config.Configure.inverted_index(index_timestamps=True),  # Allow filtering by creation time
+            properties=properties,
         )
         logging.info("Bubble collection created with vector indexing")
         logging.debug("Config check: %s", bubbles.config.get(simple=True) is not None)
@@ -380,11 +859,12 @@ def remove_all_bubbles(client):
 
         # Delete the 'Bubble' class schema
         if client.collections.get('Bubble'):
+            content_only = content_only_vectors(client.collections.get('Bubble').config.get())  # Keep how the collection is vectorized
             client.collections.delete('Bubble')
             logging.info("💨 'Bubble' class has been deleted!")
 
             # Re-create the 'Bubble' schema
-            create_bubble_schema(client)
+            create_bubble_schema(client, content_only_vectors=content_only)
             logging.info("✨ 'Bubble' class has been re-created! You're ready to bubble again! 🫧")
         
         else:
@@ -399,6 +879,7 @@ def remove_all_bubbles(client):
 def insert_bubbles_from_json(client, json_data: List[Dict]):
     """
     Insert bubbles into the Weaviate database from a provided JSON data.
+    Bulk imports load the data as-is: neither exact nor near-duplicate checks run.
     """
     try:
         collection = client.collections.get("Bubble")
@@ -432,11 +913,11 @@ class Handler:
         self.client = client
         self.user = user
 
-    def insert_bubbles(self, bubbles: List[Dict[str, Union[str, int]]]) -> Optional[List[str]]:
+    def insert_bubbles(self, bubbles: List[Dict[str, Union[str, int]]], near_duplicate_threshold: Optional[float] = None, merge_near_duplicates: bool = False) -> Optional[List[str]]:
         """
-        Insert bubbles using user-provided content and category.
+        Insert bubbles using user-provided content and category, optionally rejecting or merging near-duplicates.
         """
-        return insert_bubbles(self.client, bubbles)
+        return insert_bubbles(self.client, bubbles, near_duplicate_threshold=near_duplicate_threshold, merge_near_duplicates=merge_near_duplicates)
 
     def remove_bubble(self, uuid: str) -> bool:
         """
@@ -444,6 +925,12 @@ class Handler:
         """
         return remove_bubble(self.client, self.user, uuid)
     
+    def remove_bubbles_where(self, user: str = "", category: str = "", created_after: Optional[datetime.datetime] = None, created_before: Optional[datetime.datetime] = None, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Remove all bubbles matching a user, category and/or creation time range in bulk.
+        """
+        return remove_bubbles_where(self.client, user=user, category=category, created_after=created_after, created_before=created_before, dry_run=dry_run)
+    
     def query_most_relevant_bubbles(self, query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0) -> Optional[List[Dict[str, Union[str, int]]]]:
         """
         Query the most relevant bubbles based on the provided text and category.
@@ -451,6 +938,14 @@ class Handler:
         bubbles = query_most_relevant_bubbles(self.client, query_user=query_user, query_text=query_text, query_category=query_category, limit=limit, offset=offset)
         return bubble_add_time(bubbles)
 
+    def query_page(self, query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0) -> tuple[List[Dict], bool]:
+        """
+        Query one page of bubbles and whether another page follows.
+        """
+        bubbles = self.query_most_relevant_bubbles(query_user=query_user, query_text=query_text, query_category=query_category, limit=limit, offset=offset)
+        has_more = query_most_relevant_bubbles(self.client, query_user=query_user, query_text=query_text, query_category=query_category, limit=1, offset=offset + limit)
+        return bubbles, len(has_more) > 0
+
     async def search_users_by_profile(self, query_text: str = "", query_category: str = "", limit: int = 50, limit_user: int = 5) -> Optional[List[Dict[str, float]]]:
         """
         Search for the most relevant users based on the current user's profile.
@@ -472,8 +967,49 @@ class Handler:
         """
         return insert_bubbles_from_json(self.client, json_data)
 
-    def create_bubble_schema(self) -> bool:
+    def create_bubble_schema(self, content_only_vectors: bool = False) -> bool:
         """
         Create the bubble schema if it doesn't already exist.
         """
-        return create_bubble_schema(self.client)
\ No newline at end of file
+        return create_bubble_schema(self.client, content_only_vectors=content_only_vectors)
+
+
+class AsyncHandler:
+    """
+    Async counterpart of Handler for the read path, built on the async Weaviate and OpenAI clients.
+    All coroutines must run on the event loop the clients were connected on.
+    """
+    def __init__(self, client, openai_client, user: Optional[str] = None):
+        self.client = client
+        self.openai_client = openai_client
+        self.user = user
+
+    async def query_most_relevant_bubbles(self, query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0) -> Optional[List[Dict[str, Union[str, int]]]]:
+        """
+        Query the most relevant bubbles based on the provided text and category.
+        """
+        bubbles = await query_most_relevant_bubbles_async(self.client, query_user=query_user, query_text=query_text, query_category=query_category, limit=limit, offset=offset)
+        return bubble_add_time(bubbles)
+
+    async def query_page(self, query_user: str = "", query_text: str = "", query_category: str = "", limit: int = 10, offset: int = 0) -> tuple[List[Dict], bool]:
+        """
+        Query one page of bubbles and whether another page follows, running both queries concurrently.
+        """
+        bubbles, has_more = await asyncio.gather(
+            self.query_most_relevant_bubbles(query_user=query_user, query_text=query_text, query_category=query_category, limit=limit, offset=offset),
+            query_most_relevant_bubbles_async(self.client, query_user=query_user, query_text=query_text, query_category=query_category, limit=1, offset=offset + limit),
+        )
+        return bubbles, len(has_more) > 0
+
+    async def search_users_by_profile(self, query_text: str = "", query_category: str = "", limit: int = 50, limit_user: int = 5, user: Optional[str] = None) -> Optional[List[Dict[str, float]]]:
+        """
+        Search for the most relevant users based on the given (or current) user's profile.
+        """
+        return await perform_similarity_search_users_by_profile_async(self.client, self.openai_client, user or self.user, query_text, query_category, limit, limit_user)
+
+    async def close(self):
+        """
+        Close the async clients.
+        """
+        await self.client.close()
+        await self.openai_client.close()
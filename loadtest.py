@@ -0,0 +1,625 @@
+"""
+BSD 3-Clause License
+
+Copyright (c) 2024, yamaceay
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+    list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+    this list of conditions and the following disclaimer in the documentation
+    and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+    contributors may be used to endorse or promote products derived from
+    this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Author: Yamaç Eren Ay
+"""
+
+# Load-testing harness for the Flask app.
+#
+# Replays a configurable mix of home() traffic (feed pages, filtered searches, bubble creation and rank_users
+# submissions) from many simulated logged-in sessions, either in-process (Flask test client) or over localhost
+# (a local werkzeug server), against in-memory stand-ins for Weaviate and OpenAI with configurable latency.
+# For every concurrency level it reports throughput, p50/p95/p99 latency per route and error rates, and points
+# out where adding threads stops adding throughput.
+#
+#     python3 loadtest.py --mode inprocess --threads 1,2,4,8,16 --duration 10
+#     python3 loadtest.py --mode http --threads 4,16,64 --mix feed=60,search=25,create=10,rank=5
+
+import asyncio
+import datetime
+import fnmatch
+import http.cookiejar
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import types
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid as uuid_lib
+
+from typing import Dict, List, Optional
+import numpy as np
+
+DEFAULT_MIX = {"feed": 60, "search": 25, "create": 10, "rank": 5}
+CATEGORIES = ["Technology", "Life", "Politics", "Philosophy", "Health", ""]
+WORDS = ["ai", "future", "health", "mind", "privacy", "climate", "code", "music", "travel", "freedom", "robots", "sleep"]
+PASSWORD = "loadtest"
+
+
+# ---------------------------------------------------------------------------
+# Stand-in backends
+# ---------------------------------------------------------------------------
+
+def _matches(obj: Dict, f) -> bool:
+    """
+    Evaluate a weaviate.classes filter against a stand-in object.
+    """
+    if f is None:
+        return True
+    if hasattr(f, "filters"):
+        results = (_matches(obj, sub) for sub in f.filters)
+        return all(results) if type(f).__name__ == "_FilterAnd" else any(results)
+    if f.target == "_creationTimeUnix":
+        value = obj["creation_time"]
+    elif f.target == "_id":
+        value = obj["uuid"]
+    else:
+        value = obj["properties"].get(f.target)
+    operator = f.operator.value
+    if operator == "Equal":
+        return value == f.value
+    if operator == "NotEqual":
+        return value != f.value
+    if operator == "Like":
+        return fnmatch.fnmatchcase(value or "", f.value)
+    if operator == "GreaterThanEqual":
+        return value >= f.value
+    if operator == "LessThan":
+        return value < f.value
+    if operator == "ContainsAny":
+        return str(value) in {str(v) for v in f.value}
+    if operator == "ContainsNone":
+        return str(value) not in {str(v) for v in f.value}
+    raise ValueError(f"Stand-in filter operator '{operator}' is not supported.")
+
+
+def _as_result(obj: Dict):
+    return types.SimpleNamespace(
+        uuid=obj["uuid"],
+        properties=dict(obj["properties"]),
+        vector={"default": obj["vector"]} if obj.get("vector") else {},
+        metadata=types.SimpleNamespace(creation_time=obj["creation_time"]),
+    )
+
+
+class StandInCollection:
+    """
+    In-memory stand-in for the parts of a Weaviate collection used by lib.py.
+    Every call sleeps `latency` seconds to mimic a network round trip.
+    """
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.objects: List[Dict] = []
+        self.lock = threading.Lock()
+        self.query = self
+        self.data = self
+        self.aggregate = self
+        self.config = types.SimpleNamespace(get=self._config)
+
+    def _wait(self, extra: float = 0.0):
+        time.sleep(self.latency + extra)
+
+    def _filtered(self, filters) -> List[Dict]:
+        with self.lock:
+            return [obj for obj in self.objects if _matches(obj, filters)]
+
+    def fetch_objects(self, filters=None, limit: int = 10, offset: int = 0, sort=None, wait: bool = True, **kwargs):
+        if wait:
+            self._wait()
+        objects = sorted(self._filtered(filters), key=lambda obj: obj["creation_time"], reverse=True)
+        return types.SimpleNamespace(objects=[_as_result(obj) for obj in objects[offset:offset + limit]])
+
+    def near_text(self, query: str, filters=None, limit: int = 10, offset: int = 0, wait: bool = True, **kwargs):
+        # Vectorizing the query text is what makes near_text slower than a plain fetch
+        if wait:
+            self._wait(self.latency)
+        words = set(query.lower().split())
+        objects = sorted(self._filtered(filters), key=lambda obj: -len(words & set(obj["properties"]["content"].lower().split())))
+        return types.SimpleNamespace(objects=[_as_result(obj) for obj in objects[offset:offset + limit]])
+
+    def near_vector(self, near_vector: List[float], filters=None, limit: int = 10, distance: Optional[float] = None, **kwargs):
+        self._wait()
+        query = np.array(near_vector) / (np.linalg.norm(near_vector) or 1)
+        results = []
+        for obj in self._filtered(filters):
+            if obj.get("vector"):
+                vector = np.array(obj["vector"])
+                obj_distance = 1 - float(query @ vector / (np.linalg.norm(vector) or 1))
+                if distance is None or obj_distance <= distance:
+                    results.append((obj_distance, obj))
+        results.sort(key=lambda item: item[0])
+        objects = []
+        for obj_distance, obj in results[:limit]:
+            result = _as_result(obj)
+            result.metadata.distance = obj_distance
+            objects.append(result)
+        return types.SimpleNamespace(objects=objects)
+
+    def _config(self, simple: bool = False):
+        # Mirrors the collection created by lib.create_bubble_schema(content_only_vectors=True): content alone, embedded with lib.EMBEDDING_MODEL
+        import lib
+        skip = types.SimpleNamespace(skip=True, vectorize_property_name=False)
+        return types.SimpleNamespace(
+            vectorizer_config=types.SimpleNamespace(vectorizer=lib.wvc.config.Vectorizers.TEXT2VEC_OPENAI, model={"model": lib.EMBEDDING_MODEL}, vectorize_collection_name=False),
+            properties=[
+                types.SimpleNamespace(name="content", vectorizer_config=types.SimpleNamespace(skip=False, vectorize_property_name=False)),
+                types.SimpleNamespace(name="user", vectorizer_config=skip),
+                types.SimpleNamespace(name="category", vectorizer_config=skip),
+            ],
+            inverted_index_config=types.SimpleNamespace(index_timestamps=True),
+            vector_index_config=types.SimpleNamespace(distance_metric=lib.wvc.config.VectorDistances.COSINE),
+        )
+
+    def fetch_object_by_id(self, uuid):
+        self._wait()
+        with self.lock:
+            for obj in self.objects:
+                if str(obj["uuid"]) == str(uuid):
+                    return _as_result(obj)
+        return None
+
+    def insert_many(self, objects):
+        self._wait()
+        uuids = {}
+        with self.lock:
+            for i, data_object in enumerate(objects):
+                uuids[i] = self.add(data_object.properties, data_object.vector)
+        return types.SimpleNamespace(uuids=uuids)
+
+    def add(self, properties: Dict, vector: Optional[List[float]] = None) -> uuid_lib.UUID:
+        obj = {"uuid": uuid_lib.uuid4(), "properties": dict(properties), "vector": vector, "creation_time": datetime.datetime.now(datetime.timezone.utc)}
+        self.objects.append(obj)
+        return obj["uuid"]
+
+    def update(self, uuid, properties: Optional[Dict] = None, vector: Optional[List[float]] = None, **kwargs):
+        self._wait()
+        with self.lock:
+            for obj in self.objects:
+                if str(obj["uuid"]) == str(uuid):
+                    obj["properties"].update(properties or {})
+                    obj["vector"] = vector
+
+    def delete_by_id(self, uuid):
+        self._wait()
+        with self.lock:
+            self.objects = [obj for obj in self.objects if str(obj["uuid"]) != str(uuid)]
+
+    def delete_many(self, where, **kwargs):
+        self._wait()
+        with self.lock:
+            deleted = [obj for obj in self.objects if _matches(obj, where)]
+            self.objects = [obj for obj in self.objects if not _matches(obj, where)]
+        results = [types.SimpleNamespace(uuid=obj["uuid"], successful=True, error=None) for obj in deleted]
+        return types.SimpleNamespace(successful=len(deleted), failed=0, matches=len(deleted), objects=results if kwargs.get("verbose") else None)
+
+    def over_all(self, filters=None, total_count: bool = True, **kwargs):
+        self._wait()
+        return types.SimpleNamespace(total_count=len(self._filtered(filters)))
+
+
+class StandInClient:
+    """
+    In-memory stand-in for the Weaviate client with a single 'Bubble' collection.
+    """
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.bubbles: Optional[StandInCollection] = None
+        self.collections = self
+
+    def exists(self, name: str) -> bool:
+        return self.bubbles is not None
+
+    def create(self, name: str, **kwargs) -> StandInCollection:
+        self.bubbles = StandInCollection(self.latency)
+        return self.bubbles
+
+    def get(self, name: str) -> Optional[StandInCollection]:
+        return self.bubbles
+
+    def delete(self, name: str):
+        self.bubbles = None
+
+    def close(self):
+        pass
+
+
+class StandInOpenAI:
+    """
+    Stand-in for the module-level OpenAI API (chat completions and embeddings).
+    """
+    def __init__(self, latency: float, dim: int = 64):
+        self.latency = latency
+        self.dim = dim
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._complete))
+        self.embeddings = types.SimpleNamespace(create=self._embed)
+
+    def _complete(self, messages, wait: bool = True, **kwargs):
+        if wait:
+            time.sleep(self.latency)
+        summary = messages[-1]["content"][-200:]
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=summary))])
+
+    def _embed(self, input, wait: bool = True, **kwargs):
+        if wait:
+            time.sleep(self.latency)
+        texts = [input] if isinstance(input, str) else input
+        data = []
+        for i, text in enumerate(texts):
+            rng = random.Random(text)
+            data.append(types.SimpleNamespace(index=i, embedding=[rng.uniform(-1, 1) for _ in range(self.dim)]))
+        return types.SimpleNamespace(data=data)
+
+
+class AsyncStandInCollection:
+    """
+    Async read-only view of a StandInCollection, sleeping on the event loop instead of blocking a thread.
+    """
+    def __init__(self, collection: StandInCollection):
+        self.collection = collection
+        self.query = self
+
+    async def fetch_objects(self, **kwargs):
+        await asyncio.sleep(self.collection.latency)
+        return self.collection.fetch_objects(wait=False, **kwargs)
+
+    async def near_text(self, **kwargs):
+        await asyncio.sleep(2 * self.collection.latency)
+        return self.collection.near_text(wait=False, **kwargs)
+
+
+class AsyncStandInClient:
+    """
+    Async stand-in for the Weaviate client, sharing the data of a StandInClient.
+    """
+    def __init__(self, client: StandInClient):
+        self.client = client
+        self.collections = self
+
+    def get(self, name: str) -> AsyncStandInCollection:
+        return AsyncStandInCollection(self.client.bubbles)
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class AsyncStandInOpenAI:
+    """
+    Stand-in for the async OpenAI client.
+    """
+    def __init__(self, stand_in: StandInOpenAI):
+        self.stand_in = stand_in
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._complete))
+        self.embeddings = types.SimpleNamespace(create=self._embed)
+
+    async def _complete(self, **kwargs):
+        await asyncio.sleep(self.stand_in.latency)
+        return self.stand_in._complete(wait=False, **kwargs)
+
+    async def _embed(self, **kwargs):
+        await asyncio.sleep(self.stand_in.latency)
+        return self.stand_in._embed(wait=False, **kwargs)
+
+    async def close(self):
+        pass
+
+
+def random_text(rng: random.Random, n: int = 8) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def install_stand_ins(app_module, users: List[str], bubbles_per_user: int, weaviate_latency: float, openai_latency: float, async_backend: bool = False):
+    """
+    Point the app at stand-in backends, seed them with bubbles and accept the simulated users' logins.
+    With async_backend, reads go through async stand-ins on the app's background event loop.
+    """
+    import bcrypt
+    import lib
+    from startup import BackgroundLoop
+
+    lib.openai = StandInOpenAI(openai_latency)
+    client = StandInClient(weaviate_latency)
+    handler = lib.Handler(client, None)
+    handler.create_bubble_schema()
+    rng = random.Random(0)
+    for user in users:
+        for _ in range(bubbles_per_user):
+            client.bubbles.add({"content": random_text(rng), "user": user, "category": rng.choice(CATEGORIES)})
+
+    hashed = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=4)).decode("utf-8")
+    accounts = {user: hashed for user in users}
+    app_module.load_users = lambda: accounts
+    app_module.save_users = lambda users: None
+    app_module.handler = handler
+    if async_backend:
+        app_module.startup.install(handler, lib.AsyncHandler(AsyncStandInClient(client), AsyncStandInOpenAI(lib.openai)), BackgroundLoop())
+    else:
+        app_module.startup.install(handler)
+    return handler
+
+
+# ---------------------------------------------------------------------------
+# Simulated sessions
+# ---------------------------------------------------------------------------
+
+class InProcessSession:
+    """
+    Drives the app through the Flask test client (no sockets involved).
+    """
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def get(self, path: str, params: Optional[Dict] = None) -> int:
+        return self.client.get(path, query_string=params or {}).status_code
+
+    def post(self, path: str, data: Dict) -> int:
+        return self.client.post(path, data=data).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """
+    Drives the app over HTTP with its own cookie jar; redirects are not followed so each request is measured alone.
+    """
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def _open(self, request: urllib.request.Request) -> int:
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def get(self, path: str, params: Optional[Dict] = None) -> int:
+        query = f"?{urllib.parse.urlencode(params)}" if params else ""
+        return self._open(urllib.request.Request(f"{self.base_url}{path}{query}"))
+
+    def post(self, path: str, data: Dict) -> int:
+        return self._open(urllib.request.Request(f"{self.base_url}{path}", data=urllib.parse.urlencode(data).encode("utf-8")))
+
+
+def login(session, user: str, register: bool = False) -> bool:
+    if register:
+        session.post("/", {"action": "register", "username": user, "password": PASSWORD})
+    return session.post("/", {"action": "login", "username": user, "password": PASSWORD}) == 302
+
+
+def run_action(session, action: str, user: str, rng: random.Random) -> int:
+    """
+    Perform one home() request of the given kind and return its status code.
+    """
+    if action == "feed":
+        return session.get("/home", {"offset": rng.choice([0, 0, 0, 5, 10, 15])})
+    if action == "search":
+        params = {"query_text": random_text(rng, 2)}
+        if rng.random() < 0.5:
+            params["query_category"] = rng.choice(CATEGORIES[:-1])
+        return session.get("/home", params)
+    if action == "create":
+        return session.post("/home", {"create_bubble": "1", "content": f"{random_text(rng)} {uuid_lib.uuid4().hex[:8]}", "category": rng.choice(CATEGORIES)})
+    if action == "rank":
+        return session.post("/home", {"rank_users": "1", "query_text_rank": random_text(rng, 2), "query_category_rank": ""})
+    raise ValueError(f"Unknown action '{action}'.")
+
+
+# ---------------------------------------------------------------------------
+# Measurement and reporting
+# ---------------------------------------------------------------------------
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile of a list of values (q in [0, 100]).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_level(make_session, users: List[str], threads: int, duration: float, mix: Dict[str, int], register: bool = False, seed: int = 0) -> Dict:
+    """
+    Run `threads` simulated sessions for `duration` seconds and collect per-route latencies and errors.
+    """
+    samples: Dict[str, List[float]] = {action: [] for action in mix}
+    errors: Dict[str, int] = {action: 0 for action in mix}
+    lock = threading.Lock()
+    deadline = [0.0]
+    started = [0.0]
+
+    def start_clock():
+        # Runs once all sessions are logged in, before any of them is released
+        started[0] = time.perf_counter()
+        deadline[0] = started[0] + duration
+
+    ready = threading.Barrier(threads + 1, action=start_clock)
+
+    def worker(index: int):
+        rng = random.Random(seed * 1000 + index)
+        user = users[index % len(users)]
+        session = make_session()
+        logged_in = login(session, user, register=register)
+        ready.wait()
+        if not logged_in:
+            logging.error("Simulated user '%s' could not log in.", user)
+            return
+        actions, weights = list(mix), list(mix.values())
+        while time.perf_counter() < deadline[0]:
+            action = rng.choices(actions, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = run_action(session, action, user, rng)
+            except Exception as e:
+                logging.error("Load-test request '%s' failed: %s", action, e)
+                status = 599
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[action].append(elapsed)
+                if status >= 400:
+                    errors[action] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for w in workers:
+        w.start()
+    ready.wait()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started[0]
+
+    total = sum(len(v) for v in samples.values())
+    total_errors = sum(errors.values())
+    return {
+        "threads": threads,
+        "requests": total,
+        "throughput": round(total / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(total_errors / total, 4) if total else 0.0,
+        "routes": {
+            action: {
+                "requests": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "error_rate": round(errors[action] / len(values), 4) if values else 0.0,
+            }
+            for action, values in samples.items()
+        },
+    }
+
+
+def find_saturation(levels: List[Dict], min_gain: float = 0.1) -> Optional[int]:
+    """
+    Return the first thread count whose throughput grew less than `min_gain` over the previous level.
+    """
+    for previous, current in zip(levels, levels[1:]):
+        if current["throughput"] < previous["throughput"] * (1 + min_gain):
+            return current["threads"]
+    return None
+
+
+def print_report(levels: List[Dict]):
+    for level in levels:
+        print(f"\n== {level['threads']} threads: {level['requests']} requests, {level['throughput']} req/s, {level['error_rate']:.2%} errors")
+        print(f"{'route':<8} {'reqs':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+        for action, route in level["routes"].items():
+            print(f"{action:<8} {route['requests']:>7} {route['p50_ms']:>9} {route['p95_ms']:>9} {route['p99_ms']:>9} {route['error_rate']:>8.2%}")
+    saturation = find_saturation(levels)
+    if saturation is None:
+        print("\nThroughput kept scaling up to the highest thread count tested.")
+    else:
+        print(f"\nThroughput saturates at {saturation} threads (less than 10% gain over the previous level).")
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """
+    Parse a request mix such as 'feed=60,search=25'. Raises ValueError with a readable message if it is malformed.
+    """
+    mix = {}
+    for part in value.split(","):
+        action, sep, weight = (item.strip() for item in part.partition("="))
+        if not sep or not action or not weight:
+            raise ValueError(f"Malformed mix entry '{part.strip()}'; expected action=weight.")
+        if action not in DEFAULT_MIX:
+            raise ValueError(f"Unknown action '{action}'; expected one of {', '.join(DEFAULT_MIX)}.")
+        try:
+            mix[action] = int(weight)
+        except ValueError:
+            raise ValueError(f"Weight for '{action}' must be an integer, got '{weight}'.")
+        if mix[action] < 0:
+            raise ValueError(f"Weight for '{action}' must not be negative.")
+    if not any(mix.values()):
+        raise ValueError("At least one action in the mix needs a positive weight.")
+    return mix
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Load-test the Bubble App with simulated home() traffic")
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess', help="Drive the app through the test client or over localhost")
+    parser.add_argument('--url', default=None, help="Target an already running server instead of starting one with stand-in backends (http mode)")
+    parser.add_argument('--threads', default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument('--processes', default=1, type=int, help="Server worker processes in http mode (1 = threaded server)")
+    parser.add_argument('--duration', default=10.0, type=float, help="Seconds per concurrency level")
+    parser.add_argument('--mix', default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()), help="Request mix, e.g. feed=60,search=25,create=10,rank=5")
+    parser.add_argument('--users', default=50, type=int, help="Number of simulated users")
+    parser.add_argument('--bubbles-per-user', default=20, type=int, help="Bubbles seeded per simulated user")
+    parser.add_argument('--weaviate-latency', default=0.01, type=float, help="Stand-in Weaviate latency per call (seconds)")
+    parser.add_argument('--openai-latency', default=0.05, type=float, help="Stand-in OpenAI latency per call (seconds)")
+    parser.add_argument('--port', default=5055, type=int, help="Local server port in http mode")
+    parser.add_argument('--async-backend', action='store_true', help="Serve reads through the async handler on a background event loop")
+    parser.add_argument('--json', default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    users = [f"loadtest{i}" for i in range(args.users)]
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    server = None
+    if args.url:
+        make_session = lambda: HttpSession(args.url)
+    else:
+        # The app only needs these to be set; stand-ins never talk to the real services
+        for name in ['OPENAI_API_KEY', 'WCS_URL', 'WCS_API_KEY', 'ADMIN_USERNAME', 'ADMIN_PASSWORD']:
+            os.environ.setdefault(name, 'loadtest')
+        os.environ['WARM_UP_ON_IMPORT'] = 'false'
+        import app as app_module
+        install_stand_ins(app_module, users, args.bubbles_per_user, args.weaviate_latency, args.openai_latency, async_backend=args.async_backend)
+        if args.mode == 'http':
+            from werkzeug.serving import make_server
+            server = make_server('127.0.0.1', args.port, app_module.app, threaded=args.processes == 1, processes=args.processes)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            make_session = lambda: HttpSession(f"http://127.0.0.1:{args.port}")
+        else:
+            make_session = lambda: InProcessSession(app_module.app)
+
+    levels = []
+    for i, threads in enumerate(int(t) for t in args.threads.split(",")):
+        levels.append(run_level(make_session, users, threads, args.duration, mix, register=bool(args.url), seed=i))
+    if server:
+        server.shutdown()
+
+    print_report(levels)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(levels, f, indent=4)
@@ -0,0 +1,185 @@
+"""
+BSD 3-Clause License
+
+Copyright (c) 2024, yamaceay
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+    list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+    this list of conditions and the following disclaimer in the documentation
+    and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+    contributors may be used to endorse or promote products derived from
+    this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Author: Yamaç Eren Ay
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SingleFlightTimeoutError(TimeoutError):
+    """Raised when waiting for an in-flight call with the same key takes too long."""
+    def __init__(self, message="Timed out waiting for an identical in-flight request."):
+        self.message = message
+        super().__init__(self.message)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _SingleFlightBase:
+    """
+    Counters and metrics shared by the thread and coroutine single-flight variants.
+    Subclasses keep the calls in flight in `self._pending`, keyed by call key.
+    """
+    def __init__(self, name: str, timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout
+        self._pending: Dict[Hashable, Any] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    def _log_coalesced(self, key: Hashable):
+        # Keys can hold user content (e.g. text to summarize), so only a short digest is logged
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+        logging.info("Coalescing %s call for key %s.", self.name, digest)
+
+    def _snapshot(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._pending)
+        return stats
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Return call counters and the coalescing ratio (share of calls served by another caller's execution).
+        """
+        stats = self._snapshot()
+        stats["coalescing_ratio"] = round(stats["coalesced"] / stats["calls"], 4) if stats["calls"] else 0.0
+        return stats
+
+
+class SingleFlight(_SingleFlightBase):
+    """
+    Coalesce concurrent identical calls: the first caller for a key executes the function,
+    every caller arriving while it is in flight waits for and shares its result (or exception).
+    """
+    def __init__(self, name: str, timeout: Optional[float] = None):
+        super().__init__(name, timeout)
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable, *args, wait_timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` unless a call with the same key is already in flight.
+        Waiting callers give up after `wait_timeout` seconds (default: the instance timeout).
+        `wait_timeout` is reserved for the single-flight layer; every other keyword argument, `timeout` included, goes to `fn`.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._pending.get(key)
+            leader = call is None
+            if leader:
+                call = self._pending[key] = _Call()
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self._stats["errors"] += 1
+            finally:
+                with self._lock:
+                    del self._pending[key]
+                call.done.set()
+        else:
+            self._log_coalesced(key)
+            if not call.done.wait(self.timeout if wait_timeout is None else wait_timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise SingleFlightTimeoutError(f"Timed out waiting for in-flight {self.name} call.")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return super()._snapshot()
+
+
+class AsyncSingleFlight(_SingleFlightBase):
+    """
+    Single-flight for coroutines on one event loop: callers of an in-flight key await the leader's future.
+    All bookkeeping happens on the loop, so no lock is needed.
+    """
+    async def do(self, key: Hashable, fn: Callable, *args, wait_timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Await `fn(*args, **kwargs)` unless a call with the same key is already in flight.
+        If the leader is cancelled, waiting callers get a SingleFlightTimeoutError they can retry.
+        """
+        self._stats["calls"] += 1
+        future = self._pending.get(key)
+        if future is None:
+            self._stats["executions"] += 1
+            future = self._pending[key] = asyncio.get_running_loop().create_future()
+            try:
+                result = await fn(*args, **kwargs)
+                future.set_result(result)
+                return result
+            except asyncio.CancelledError:
+                # Only the leader was cancelled; the callers waiting on it should retry rather than see a cancellation
+                future.set_exception(SingleFlightTimeoutError(f"In-flight {self.name} call was cancelled."))
+                future.exception()  # Mark as retrieved when no caller is waiting
+                raise
+            except BaseException as e:
+                self._stats["errors"] += 1
+                future.set_exception(e)
+                future.exception()  # Mark as retrieved when no caller is waiting
+                raise
+            finally:
+                del self._pending[key]
+
+        self._stats["coalesced"] += 1
+        self._log_coalesced(key)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout if wait_timeout is None else wait_timeout)
+        except SingleFlightTimeoutError:
+            raise  # The leader was cancelled; TimeoutError below would otherwise catch it too
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise SingleFlightTimeoutError(f"Timed out waiting for in-flight {self.name} call.")
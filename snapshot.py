@@ -0,0 +1,345 @@
+"""
+BSD 3-Clause License
+
+Copyright (c) 2024, yamaceay
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+    list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+    this list of conditions and the following disclaimer in the documentation
+    and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+    contributors may be used to endorse or promote products derived from
+    this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Author: Yamaç Eren Ay
+"""
+
+import datetime
+import json
+import logging
+import mmap
+import os
+import shutil
+import uuid as uuid_lib
+
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+import weaviate.classes as wvc
+
+from lib import DatabaseError, get_default_vector
+
+# Snapshot layout (one directory per snapshot):
+#   manifest.json        - format version, row count, vector dimension, user / category vocabularies
+#   vectors.npy          - float32 (count, dim) bubble vectors
+#   uuids.npy            - uint8 (count, 16) raw bubble UUIDs
+#   user_codes.npy       - int32 (count,) index into manifest["users"]
+#   category_codes.npy   - int32 (count,) index into manifest["categories"]
+#   creation_times.npy   - int64 (count,) creation time in ms since epoch, -1 if unknown
+#   content_offsets.npy  - int64 (count + 1,) byte offsets of each content string in the heap
+#   strings.bin          - UTF-8 heap of all bubble contents, back to back
+SNAPSHOT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+HEAP_FILE = "strings.bin"
+COLUMNS = {
+    "uuids": np.uint8,
+    "user_codes": np.int32,
+    "category_codes": np.int32,
+    "creation_times": np.int64,
+    "content_offsets": np.int64,
+}
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot cannot be written or read."""
+    def __init__(self, message="The snapshot is missing or corrupted."):
+        self.message = message
+        super().__init__(self.message)
+
+
+def _to_millis(created_at: Optional[datetime.datetime]) -> int:
+    if created_at is None:
+        return -1
+    return int(created_at.timestamp() * 1000)
+
+
+def _open_columns(tmp_dir: str, count: int, dim: int) -> Dict[str, np.ndarray]:
+    """
+    Allocate memory-mapped .npy files for the vectors and every metadata column.
+    """
+    columns = {"vectors": np.lib.format.open_memmap(os.path.join(tmp_dir, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count, dim))}
+    for name, dtype in COLUMNS.items():
+        shape = (count, 16) if name == "uuids" else (count + 1,) if name == "content_offsets" else (count,)
+        columns[name] = np.lib.format.open_memmap(os.path.join(tmp_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+    return columns
+
+
+def _trim_columns(tmp_dir: str, written: int):
+    """
+    Shrink every column to the number of rows actually written (objects deleted during export).
+    """
+    for name in ["vectors", *COLUMNS]:
+        rows = written + 1 if name == "content_offsets" else written
+        column_path = os.path.join(tmp_dir, f"{name}.npy")
+        trimmed = np.array(np.load(column_path, mmap_mode="r")[:rows])
+        np.save(f"{column_path}.trim.npy", trimmed)
+        os.replace(f"{column_path}.trim.npy", column_path)
+
+
+def export_snapshot(client, path: str) -> int:
+    """
+    Export all bubbles, their vectors and metadata into a memory-mappable snapshot directory.
+    The snapshot is written next to `path` first and moved into place once complete; an existing
+    directory at `path` is only replaced if it is a snapshot itself.
+    """
+    path = os.path.abspath(path)
+    if os.path.exists(path) and not os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+        raise SnapshotError(f"Refusing to replace '{path}': it exists and is not a snapshot.")
+    logging.info("Exporting bubble snapshot to '%s'...", path)
+    collection = client.collections.get("Bubble")
+    try:
+        count = collection.aggregate.over_all(total_count=True).total_count
+    except Exception as e:
+        logging.error("An error occurred while counting bubbles: %s", e)
+        raise DatabaseError("Failed to count bubbles for the snapshot.")
+
+    tmp_dir = f"{path}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    users: Dict[str, int] = {}
+    categories: Dict[str, int] = {}
+    columns = None
+    dim = 0
+    written = 0
+    heap_offset = 0
+    try:
+        with open(os.path.join(tmp_dir, HEAP_FILE), "wb") as heap:
+            iterator = collection.iterator(
+                include_vector=True,
+                return_metadata=wvc.query.MetadataQuery(creation_time=True),
+            )
+            for obj in iterator:
+                if written >= count:
+                    logging.warning("More bubbles than counted; ignoring bubbles inserted during export.")
+                    break
+                vector = get_default_vector(obj)
+                if vector is None:
+                    logging.warning("Skipping bubble %s without a vector.", obj.uuid)
+                    continue
+                if columns is None:
+                    dim = len(vector)
+                    columns = _open_columns(tmp_dir, count, dim)
+                    columns["content_offsets"][0] = 0
+                elif len(vector) != dim:
+                    raise SnapshotError(f"Bubble {obj.uuid} has vector dimension {len(vector)}, expected {dim}.")
+
+                content = (obj.properties.get("content") or "").encode("utf-8")
+                heap.write(content)
+                heap_offset += len(content)
+
+                user = obj.properties.get("user") or ""
+                category = obj.properties.get("category") or ""
+                columns["vectors"][written] = vector
+                columns["uuids"][written] = np.frombuffer(obj.uuid.bytes, dtype=np.uint8)
+                columns["user_codes"][written] = users.setdefault(user, len(users))
+                columns["category_codes"][written] = categories.setdefault(category, len(categories))
+                columns["creation_times"][written] = _to_millis(obj.metadata.creation_time)
+                columns["content_offsets"][written + 1] = heap_offset
+                written += 1
+    except SnapshotError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        logging.error("An error occurred while exporting the snapshot: %s", e)
+        raise DatabaseError("Failed to export bubbles into the snapshot.")
+
+    if columns is None:
+        columns = _open_columns(tmp_dir, 0, 0)
+    for array in columns.values():
+        array.flush()
+    del columns
+    if written < count:
+        logging.warning("Fewer bubbles than counted (%d < %d); trimming snapshot.", written, count)
+        _trim_columns(tmp_dir, written)
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "count": written,
+        "dim": dim,
+        "users": list(users),
+        "categories": list(categories),
+        "exported_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+
+    # Move the old snapshot aside first so a failure never leaves neither in place
+    old_dir = f"{path}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_dir)
+    os.replace(tmp_dir, path)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logging.info("Exported %d bubbles (dim=%d) to '%s'.", written, dim, path)
+    return written
+
+
+class BubbleSnapshot:
+    """
+    Read-only, zero-copy view of a snapshot directory. All columns are memory-mapped,
+    so worker processes loading the same snapshot share the underlying pages.
+    """
+    def __init__(self, path: str):
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise SnapshotError(f"No snapshot found at '{path}'.")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != SNAPSHOT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot version: {self.manifest.get('version')}.")
+
+        self.path = path
+        self.users: List[str] = self.manifest["users"]
+        self.categories: List[str] = self.manifest["categories"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.uuids = np.load(os.path.join(path, "uuids.npy"), mmap_mode="r")
+        self.user_codes = np.load(os.path.join(path, "user_codes.npy"), mmap_mode="r")
+        self.category_codes = np.load(os.path.join(path, "category_codes.npy"), mmap_mode="r")
+        self.creation_times = np.load(os.path.join(path, "creation_times.npy"), mmap_mode="r")
+        self.content_offsets = np.load(os.path.join(path, "content_offsets.npy"), mmap_mode="r")
+        if len(self.vectors) != self.manifest["count"] or len(self.content_offsets) != self.manifest["count"] + 1:
+            raise SnapshotError(f"Snapshot at '{path}' does not match its manifest.")
+
+        # mmap cannot map empty files, so an empty heap is kept as plain bytes
+        heap_path = os.path.join(path, HEAP_FILE)
+        if os.path.getsize(heap_path) > 0:
+            with open(heap_path, "rb") as f:
+                self.heap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.heap = b""
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def content(self, i: int) -> str:
+        start, end = int(self.content_offsets[i]), int(self.content_offsets[i + 1])
+        return self.heap[start:end].decode("utf-8")
+
+    def user(self, i: int) -> str:
+        return self.users[self.user_codes[i]]
+
+    def category(self, i: int) -> str:
+        return self.categories[self.category_codes[i]]
+
+    def uuid(self, i: int) -> uuid_lib.UUID:
+        return uuid_lib.UUID(bytes=self.uuids[i].tobytes())
+
+    def created_at(self, i: int) -> Optional[datetime.datetime]:
+        millis = int(self.creation_times[i])
+        if millis < 0:
+            return None
+        return datetime.datetime.fromtimestamp(millis / 1000, tz=datetime.timezone.utc)
+
+    def rows_for_user(self, user: str) -> np.ndarray:
+        """
+        Return the row indices of all bubbles by the given user.
+        """
+        if user not in self.users:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.user_codes == self.users.index(user))
+
+    def bubble(self, i: int) -> Dict:
+        """
+        Return a bubble in the same shape as `process_bubbles_response`.
+        """
+        return {
+            "content": self.content(i),
+            "user": self.user(i),
+            "category": self.category(i),
+            "created_at": self.created_at(i),
+            "uuid": self.uuid(i),
+        }
+
+    def bubbles(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self.bubble(i)
+
+    def close(self):
+        if isinstance(self.heap, mmap.mmap):
+            self.heap.close()
+
+
+def load_snapshot(path: str) -> BubbleSnapshot:
+    """
+    Load a snapshot directory with all columns memory-mapped (no data is copied).
+    """
+    logging.info("Loading bubble snapshot from '%s'...", path)
+    return BubbleSnapshot(path)
+
+
+def import_snapshot(client, path: str) -> int:
+    """
+    Restore bubbles from a snapshot into the Weaviate database, keeping their UUIDs and vectors
+    so nothing has to be re-vectorized. Creation times are assigned anew by Weaviate.
+    """
+    snapshot = load_snapshot(path)
+    logging.info("Importing %d bubbles from snapshot '%s'...", len(snapshot), path)
+    try:
+        collection = client.collections.get("Bubble")
+        with collection.batch.dynamic() as batch:
+            for i in range(len(snapshot)):
+                batch.add_object(
+                    properties={"content": snapshot.content(i), "user": snapshot.user(i), "category": snapshot.category(i)},
+                    uuid=snapshot.uuid(i),
+                    vector=snapshot.vectors[i].tolist(),
+                )
+        failed = collection.batch.failed_objects
+    except Exception as e:
+        logging.error("An error occurred while importing the snapshot: %s", e)
+        raise DatabaseError("Failed to import bubbles from the snapshot.")
+    finally:
+        snapshot.close()
+    if failed:
+        logging.error("%d bubbles failed to import from the snapshot.", len(failed))
+    return len(snapshot) - len(failed)
+
+
+if __name__ == '__main__':
+    import argparse
+    from dotenv import load_dotenv
+    from lib import connect_weaviate_client, create_bubble_schema
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Export or import a memory-mapped snapshot of all bubbles")
+    parser.add_argument('command', choices=['export', 'import'], help="Snapshot operation")
+    parser.add_argument('path', help="Snapshot directory")
+    parser.add_argument('--content-only-vectors', action='store_true', help="Create a missing collection with content-only vectors (as exported from such a collection)")
+    args = parser.parse_args()
+
+    client = connect_weaviate_client(os.getenv('OPENAI_API_KEY'), os.getenv('WCS_URL'), os.getenv('WCS_API_KEY'))
+    try:
+        if args.command == 'export':
+            print(f"Exported {export_snapshot(client, args.path)} bubbles to '{args.path}'.")
+        else:
+            create_bubble_schema(client, content_only_vectors=args.content_only_vectors)
+            print(f"Imported {import_snapshot(client, args.path)} bubbles from '{args.path}'.")
+    finally:
+        client.close()
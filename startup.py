@@ -0,0 +1,267 @@
+"""
+BSD 3-Clause License
+
+Copyright (c) 2024, yamaceay
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+    list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+    this list of conditions and the following disclaimer in the documentation
+    and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+    contributors may be used to endorse or promote products derived from
+    this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Author: Yamaç Eren Ay
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+
+from typing import Dict, List, Optional
+
+from lib import AsyncHandler, Handler, connect_weaviate_client, connect_weaviate_async_client, connect_openai_async_client
+
+# Backoff between failed warm-up attempts (seconds)
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# Modules imported lazily by lib.py that every request path ends up needing
+WARM_UP_MODULES = ["numpy", "openai", "weaviate", "weaviate.classes", "humanize"]
+
+
+class BackgroundLoop:
+    """
+    Event loop running in a daemon thread. Request threads submit coroutines to it, so one worker
+    keeps many backend calls in flight on a single set of async clients.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="async-backend", daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        Run a coroutine on the loop and block the calling thread until it finishes.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class Startup:
+    """
+    Tracks the application lifecycle (starting -> ready, or failed -> retrying) and the duration of every warm-up phase.
+    """
+    def __init__(self):
+        self._start_args: Optional[Dict] = None
+        self._reset()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self.started_at = time.monotonic()
+        self.status = "starting"
+        self.error: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        self.handler: Optional[Handler] = None
+        self.async_handler: Optional[AsyncHandler] = None
+        self.background: Optional[BackgroundLoop] = None
+        self.attempts = 0
+        self.retry_in: Optional[float] = None
+        self._lock = threading.Lock()
+        self._attempted = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _after_fork(self):
+        # Threads do not survive fork (e.g. gunicorn --preload), so a child of a process that started the warm-up
+        # has no warm-up thread or event loop; drop the parent's clients and warm up again on first use
+        if self._start_args is not None:
+            self._reset()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Time a named warm-up phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 4)
+            logging.info("Startup phase '%s' took %.3fs.", name, self.phases[name])
+
+    def warm_up(self, openai_api_key: str, wcs_url: str, wcs_api_key: str, modules: List[str] = WARM_UP_MODULES, async_backend: bool = False, content_only_vectors: bool = False) -> Optional[Handler]:
+        """
+        Import deferred modules, connect to Weaviate, verify the schema once and prime the connection.
+        A missing collection is created with content_only_vectors (see `lib.create_bubble_schema`). With async_backend, also connect the async Weaviate and OpenAI clients on a background event loop.
+        A failed attempt closes whatever it connected and leaves the state "failed" for the probes.
+        Safe to call from several threads; only the first successful call does the work.
+        """
+        with self._lock:
+            if self.ready:
+                return self.handler
+            self.attempts += 1
+            handler = None
+            try:
+                with self.phase("imports"):
+                    for module in modules:
+                        __import__(module)
+                    import openai
+                    openai.api_key = openai_api_key
+                with self.phase("connect"):
+                    handler = Handler(connect_weaviate_client(openai_api_key, wcs_url, wcs_api_key), None)
+                with self.phase("schema"):
+                    handler.create_bubble_schema(content_only_vectors=content_only_vectors)
+                with self.phase("prime"):
+                    # A first cheap query opens the connection pool so real traffic does not pay for it.
+                    # It goes to the collection directly: the query helpers log errors and return [], which would hide a broken backend
+                    handler.client.collections.get("Bubble").query.fetch_objects(limit=1)
+                if async_backend:
+                    with self.phase("connect_async"):
+                        self.background = self.background or BackgroundLoop()
+                        self.async_handler = self.background.run(self._connect_async(openai_api_key, wcs_url, wcs_api_key))
+                self.handler = handler
+                self.status = "ready"
+                self.error = None
+                logging.info("Startup finished in %.3fs.", sum(self.phases.values()))
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                logging.error("Startup attempt %d failed: %s", self.attempts, e)
+                if handler is not None:
+                    try:
+                        handler.client.close()
+                    except Exception as close_error:
+                        logging.error("An error occurred while closing the Weaviate client: %s", close_error)
+            return self.handler
+
+    def start(self, openai_api_key: str, wcs_url: str, wcs_api_key: str, async_backend: bool = False, content_only_vectors: bool = False) -> threading.Thread:
+        """
+        Warm up in a background thread, retrying with exponential backoff until ready,
+        so servers that only import the app become ready without waiting for user traffic.
+        """
+        with self._lock:
+            self._start_args = dict(openai_api_key=openai_api_key, wcs_url=wcs_url, wcs_api_key=wcs_api_key, async_backend=async_backend, content_only_vectors=content_only_vectors)
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+
+            def run():
+                delay = RETRY_INITIAL_DELAY
+                while not self.ready:
+                    self.warm_up(openai_api_key, wcs_url, wcs_api_key, async_backend=async_backend, content_only_vectors=content_only_vectors)
+                    self._attempted.set()
+                    if self.ready:
+                        break
+                    self.retry_in = delay
+                    time.sleep(delay)
+                    delay = min(delay * 2, RETRY_MAX_DELAY)
+                self.retry_in = None
+
+            self._thread = threading.Thread(target=run, name="warm-up", daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def ensure_started(self):
+        """
+        Start warming up in a forked worker whose parent had started it; a no-op otherwise.
+        """
+        if self._start_args is not None and self._thread is None:
+            self.start(**self._start_args)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the first warm-up attempt finished; return whether the app is ready.
+        """
+        self._attempted.wait(timeout)
+        return self.ready
+
+    def install(self, handler: Handler, async_handler: Optional[AsyncHandler] = None, background: Optional[BackgroundLoop] = None):
+        """
+        Mark the app ready with already connected handlers (e.g. stand-in backends).
+        """
+        with self._lock:
+            self.handler = handler
+            self.async_handler = async_handler
+            self.background = background or self.background
+            self.status = "ready"
+            self.error = None
+        self._attempted.set()
+
+    @staticmethod
+    async def _connect_async(openai_api_key: str, wcs_url: str, wcs_api_key: str) -> AsyncHandler:
+        # The clients are created on the background loop so they are bound to it
+        client = connect_weaviate_async_client(openai_api_key, wcs_url, wcs_api_key)
+        async_handler = AsyncHandler(client, connect_openai_async_client(openai_api_key))
+        try:
+            await client.connect()
+            await client.collections.get("Bubble").query.fetch_objects(limit=1)
+        except Exception:
+            await async_handler.close()
+            raise
+        return async_handler
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        Run a coroutine of the async handler on the background loop from a request thread.
+        """
+        return self.background.run(coro, timeout)
+
+    def shutdown(self):
+        """
+        Close the async clients and stop the background loop.
+        """
+        if self.background is None:
+            return
+        if self.async_handler is not None:
+            try:
+                self.background.run(self.async_handler.close(), timeout=10)
+            except Exception as e:
+                logging.error("An error occurred while closing the async clients: %s", e)
+        self.background.stop()
+        self.background = None
+        self.async_handler = None
+
+    def report(self) -> Dict:
+        """
+        Return the startup status and phase timings, e.g. for readiness endpoints.
+        """
+        return {
+            "status": self.status,
+            "error": self.error,
+            "uptime": round(self.uptime(), 3),
+            "startup_time": round(sum(self.phases.values()), 4),
+            "phases": dict(self.phases),
+            "attempts": self.attempts,
+            "retry_in": self.retry_in,
+            "async_backend": self.async_handler is not None,
+        }